@@ -0,0 +1,166 @@
+"""HTTP record/replay archive for offline, deterministic tap runs."""
+
+import hashlib
+import json
+import threading
+import zipfile
+from pathlib import Path
+from typing import Any, Dict
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+ARCHIVE_MODES = ("record", "replay")
+
+# Response headers that are never written to an archive.
+EXCLUDED_HEADERS = {"set-cookie"}
+
+
+class HttpArchiveMiss(LookupError):
+    """Raised when a replayed request has no recorded response."""
+
+
+class HttpArchive:
+    """A zip archive of HTTP responses, indexed by request method and URL.
+
+    Each exchange is stored as a `<n>.json` entry holding the request URL and
+    the response status and headers, plus a `<n>.body` entry holding the raw
+    response body. `index.json` maps request keys to entry numbers.
+    """
+
+    INDEX_NAME = "index.json"
+
+    def __init__(self, path: Path, mode: str) -> None:
+        """Open the archive at `path` for recording or replaying."""
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"Unknown HTTP archive mode '{mode}'.")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._index: Dict[str, str] = {}
+        self._entry_count = 0
+        if mode == "record":
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        else:
+            self._zip = zipfile.ZipFile(path, "r")
+            self._index = self._read_index()
+
+    @staticmethod
+    def request_key(request: requests.PreparedRequest) -> str:
+        """Return the archive key for a request."""
+        return hashlib.sha1(f"{request.method} {request.url}".encode()).hexdigest()
+
+    def _read_index(self) -> Dict[str, str]:
+        """Read the index, rebuilding it from entries if a recording was cut short."""
+        if self.INDEX_NAME in self._zip.namelist():
+            return json.loads(self._zip.read(self.INDEX_NAME))
+        index = {}
+        for name in sorted(self._zip.namelist()):
+            if name.endswith(".json"):
+                entry = json.loads(self._zip.read(name))
+                index[entry["key"]] = name[: -len(".json")]
+        return index
+
+    def record(
+        self, request: requests.PreparedRequest, response: requests.Response
+    ) -> None:
+        """Add a request's response to the archive, unless its key is recorded.
+
+        Only the first response to a request is kept, so repeated requests, e.g.
+        of a daemon's sync cycles, do not grow the archive.
+        """
+        key = self.request_key(request)
+        entry: Dict[str, Any] = {
+            "key": key,
+            "method": request.method,
+            "url": request.url,
+            "status_code": response.status_code,
+            "reason": response.reason,
+            "encoding": response.encoding,
+            "headers": {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in EXCLUDED_HEADERS
+            },
+        }
+        with self._lock:
+            if key in self._index:
+                return
+            name = f"{self._entry_count:08d}"
+            self._entry_count += 1
+            self._zip.writestr(f"{name}.json", json.dumps(entry))
+            self._zip.writestr(f"{name}.body", response.content)
+            self._index[key] = name
+
+    def replay(self, request: requests.PreparedRequest) -> requests.Response:
+        """Return the recorded response for a request."""
+        name = self._index.get(self.request_key(request))
+        if name is None:
+            raise HttpArchiveMiss(f"No recorded response for {request.url}")
+        with self._lock:
+            entry = json.loads(self._zip.read(f"{name}.json"))
+            body = self._zip.read(f"{name}.body")
+        response = requests.Response()
+        response.status_code = entry["status_code"]
+        response.reason = entry["reason"]
+        response.encoding = entry["encoding"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = body
+        response.url = request.url or entry["url"]
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        """Write the index, when recording, and close the archive."""
+        with self._lock:
+            if self.mode == "record":
+                self._zip.writestr(self.INDEX_NAME, json.dumps(self._index))
+            self._zip.close()
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that sends requests and records their responses."""
+
+    def __init__(self, archive: HttpArchive, **kwargs: Any) -> None:
+        """Initialize the adapter to record responses into `archive`."""
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(  # type: ignore[override]
+        self, request: requests.PreparedRequest, **kwargs: Any
+    ) -> requests.Response:
+        """Send the request and record the response."""
+        response = super().send(request, **kwargs)
+        self.archive.record(request, response)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter that serves recorded responses without any network."""
+
+    def __init__(self, archive: HttpArchive) -> None:
+        """Initialize the adapter to serve responses from `archive`."""
+        super().__init__()
+        self.archive = archive
+
+    def send(  # type: ignore[override]
+        self, request: requests.PreparedRequest, **kwargs: Any
+    ) -> requests.Response:
+        """Return the recorded response for the request."""
+        return self.archive.replay(request)
+
+    def close(self) -> None:
+        """Release adapter resources (none are held)."""
+
+
+def mount_archive(session: requests.Session, archive: HttpArchive) -> None:
+    """Route all of a session's HTTP(S) traffic through the archive."""
+    adapter: BaseAdapter
+    if archive.mode == "record":
+        adapter = RecordingAdapter(archive)
+    else:
+        adapter = ReplayAdapter(archive)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
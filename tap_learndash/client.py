@@ -1,24 +1,160 @@
 """REST client handling, including LearnDashStream base class."""
 
 import base64
+import collections
+import copy
+import datetime
+import math
+import time
 import requests
 from pathlib import Path
-from typing import Any, Dict, Optional, Union, List, Iterable
+from concurrent.futures import Executor
+from urllib.parse import quote
+from typing import (
+    Any, Callable, Dict, Optional, Union, List, Iterable, Iterator, Tuple,
+    TYPE_CHECKING, cast
+)
 
+from singer_sdk import typing as th
 from singer_sdk.streams import RESTStream
 
+from tap_learndash.pipeline import prefetch
+from tap_learndash.planner import plan_id_windows
+from tap_learndash.state import IdRangeSet, PartitionWatermark, ResumeCursor
+
+if TYPE_CHECKING:
+    from tap_learndash.tap import TapLearnDash
+
 #SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
 
 
+class RuntimeBudgetExhausted(Exception):
+    """Raised when a sync runs past the configured `max_runtime_seconds`."""
+
+
+def utc_now() -> str:
+    """Return the current UTC time as an ISO 8601 string."""
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def parse_utc(value: str) -> datetime.datetime:
+    """Return a UTC datetime from an ISO 8601 string written by `utc_now`."""
+    moment = datetime.datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+    return moment.replace(tzinfo=datetime.timezone.utc)
+
+
+def get_modified_after(modified_gmt: str) -> str:
+    """Return a `modified_after` filter value matching a `modified_gmt` value.
+
+    WordPress compares `modified_after` with local modification times, so the
+    value is marked as UTC. It is also one second early, as the filter is
+    exclusive and another record may have been saved in the same second after
+    the last sync read its records.
+    """
+    if len(modified_gmt) == len("YYYY-MM-DD"):
+        modified_gmt += "T00:00:00"
+    moment = datetime.datetime.strptime(modified_gmt[:19], "%Y-%m-%dT%H:%M:%S")
+    return (moment - datetime.timedelta(seconds=1)).isoformat() + "+00:00"
+
+
+def ordered_map(
+    executor: Executor, func: Callable[[Any], Any], items: Iterable[Any], window: int
+) -> Iterator[Any]:
+    """Apply `func` to `items` on `executor`, yielding results in order.
+
+    At most `window` calls are in flight at once; calls not yet started when
+    the consumer stops early are cancelled.
+    """
+    pending: collections.deque = collections.deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
 class LearnDashStream(RESTStream):
     """LearnDash stream class."""
 
     _page_size = 100
+    _max_page_size = 100
+    # Most ids listed in one `include` parameter; longer URLs risk HTTP 414.
+    _max_include_ids = 500
+    _http_session: Optional[requests.Session] = None
+    api_path = "/wp-json/ldlms/v2"
+    # State is kept per site only. Child partitions are not given their own
+    # state entries; the ids of the finished ones are tracked compactly instead.
+    state_partitioning_keys = ["site_id"]
+    # Context key identifying a child stream's partitions, e.g. "user_id".
+    partition_key: Optional[str] = None
+    # Record fields `get_child_context` reads, all that is requested when the
+    # stream is only synced to provide contexts for its selected children.
+    child_context_fields = ["id"]
+    # LearnDash post type of course steps, e.g. "sfwd-lessons", for streams that
+    # can be scoped to the steps of a site's configured `course_ids`.
+    step_type: Optional[str] = None
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Initialize the stream, keying records by site when extracting many sites."""
+        super().__init__(*args, **kwargs)
+        self._synced_partitions: Dict[Optional[str], PartitionWatermark] = {}
+        if self.config.get("sites"):
+            self.schema = {
+                **self.schema,
+                "properties": {
+                    "site_id": th.StringType.type_dict,
+                    **self.schema["properties"],
+                },
+            }
+            self.primary_keys = ["site_id", *self.primary_keys]
+
+    @property
+    def tap(self) -> "TapLearnDash":
+        """Return the tap this stream belongs to."""
+        return cast("TapLearnDash", self._tap)
+
+    @property
+    def requests_session(self) -> requests.Session:
+        """Return the stream's HTTP session, routed through any HTTP archive."""
+        if self._http_session is None:
+            self._http_session = self.tap.create_http_session()
+        return self._http_session
+
+    @property
+    def prefetch_depth(self) -> int:
+        """Return how many pages may be fetched ahead of the one being processed."""
+        return int(self.config.get("prefetch_depth", 1))
+
+    @property
+    def is_context_only(self) -> bool:
+        """Return True if the stream only syncs to provide child stream contexts."""
+        return not self.selected and self.has_selected_descendents
+
+    def is_course_scoped(self, context: Optional[dict]) -> bool:
+        """Return True if only steps of the site's `course_ids` are synced."""
+        return self.step_type is not None and bool(self.get_course_ids(context))
+
+    @property
+    def is_sliced(self) -> bool:
+        """Return True if the stream is requested in id windows."""
+        return self.name in self.config.get("sliced_streams", [])
+
+    @property
+    def page_workers(self) -> int:
+        """Return how many pages of this stream may be requested concurrently."""
+        if self.tap.plan is None:
+            return 1
+        return self.tap.plan.workers_for(self.name, self.tap.max_workers)
 
     @property
     def url_base(self) -> str:
         """Return the API URL root, configurable via tap settings."""
-        return self.config["api_url"] + "/wp-json/ldlms/v2"
+        return self.config.get("api_url", "") + self.api_path
 
     @property
     def http_headers(self) -> dict:
@@ -26,13 +162,102 @@ class LearnDashStream(RESTStream):
         headers = {}
         if "user_agent" in self.config:
             headers["User-Agent"] = self.config.get("user_agent")
+        return headers
+
+    def get_site(self, context: Optional[dict]) -> dict:
+        """Return the connection settings of the site a context belongs to."""
+        site_id = (context or {}).get("site_id")
+        if site_id is None:
+            return dict(self.config)
+        return self.tap.sites[site_id]
+
+    def get_course_ids(self, context: Optional[dict]) -> List[int]:
+        """Return the `course_ids` configured for the context's site, if any."""
+        return self.get_site(context).get("course_ids") or []
+
+    @staticmethod
+    def get_site_context(context: Optional[dict]) -> dict:
+        """Return the part of a context identifying its site, if any."""
+        if context and "site_id" in context:
+            return {"site_id": context["site_id"]}
+        return {}
+
+    def get_url(self, context: Optional[dict]) -> str:
+        """Return the URL of the endpoint on the context's site."""
+        path = self.path
+        for key, value in (context or {}).items():
+            path = path.replace(f"{{{key}}}", quote(str(value)))
+        return self.get_site(context)["api_url"] + self.api_path + path
 
-        # Authentication
-        raw_credentials = f"{self.config['username']}:{self.config['password']}"
+    def prepare_request(
+        self, context: Optional[dict], next_page_token: Optional[Any]
+    ) -> requests.PreparedRequest:
+        """Prepare a request, authenticated for the context's site."""
+        request = super().prepare_request(context, next_page_token)
+        self.authenticate(request, context)
+        return request
+
+    def authenticate(
+        self, request: requests.PreparedRequest, context: Optional[dict]
+    ) -> None:
+        """Add the context's site credentials to a request."""
+        site = self.get_site(context)
+        raw_credentials = f"{site['username']}:{site['password']}"
         auth_token = base64.b64encode(raw_credentials.encode()).decode("ascii")
-        headers["Authorization"] = f"Basic {auth_token}"
+        request.headers["Authorization"] = f"Basic {auth_token}"
 
-        return headers
+    def _request(
+        self, prepared_request: requests.PreparedRequest, context: Optional[dict]
+    ) -> requests.Response:
+        """Send a request once a tap-wide request slot and the rate limiter allow it."""
+        with self.tap.request_slots:
+            self.tap.rate_limiter.acquire()
+            return super()._request(prepared_request, context)
+
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        """Return records, tagged with the keys of their context."""
+        progress = self.tap.progress if not self.parent_stream_type else None
+        for record in super().get_records(context):
+            for key, value in (context or {}).items():
+                record.setdefault(key, value)
+            if progress:
+                progress.advance(self.name)
+            yield record
+
+    # Streams of different sites sync in parallel threads and share the tap
+    # state, so STATE mutations and all message writes are serialized.
+
+    @property
+    def stream_state(self) -> dict:
+        """Return the writeable state of this stream."""
+        with self.tap.state_lock:
+            return super().stream_state
+
+    def get_context_state(self, context: Optional[dict]) -> dict:
+        """Return the writeable state of a context of this stream."""
+        with self.tap.state_lock:
+            return super().get_context_state(context)
+
+    def finalize_state_progress_markers(self, state: Optional[dict] = None) -> None:
+        """Promote or reset progress markers once a sync completes."""
+        with self.tap.state_lock:
+            super().finalize_state_progress_markers(state)
+
+    def _write_starting_replication_value(self, context: Optional[dict]) -> None:
+        with self.tap.state_lock:
+            super()._write_starting_replication_value(context)
+
+    def _write_schema_message(self) -> None:
+        with self.tap.state_lock:
+            super()._write_schema_message()
+
+    def _write_record_message(self, record: dict) -> None:
+        with self.tap.state_lock:
+            super()._write_record_message(record)
+
+    def _write_state_message(self) -> None:
+        with self.tap.state_lock:
+            super()._write_state_message()
 
     def parse_response(self, response: requests.Response) -> Iterable[dict]:
         """Parse the response and return an iterator of result rows."""
@@ -56,10 +281,426 @@ class LearnDashStream(RESTStream):
         self, context: Optional[dict], next_page_token: Optional[Any]
     ) -> Dict[str, Any]:
         """Return a dictionary of values to be used in URL parameterization."""
-        params = {
+        params: Dict[str, Any] = {
             "per_page": self._page_size,
             "page": 1
         }
         if next_page_token:
             params["page"] = next_page_token
+        if self.is_context_only:
+            params["_fields"] = ",".join(self.child_context_fields)
+            params["per_page"] = self._max_page_size
+        if self.child_streams or not self.parent_stream_type:
+            # Paging top-level streams in id order lets an interrupted sync resume
+            # after its last record, and child partitions start in id order, so
+            # the finished ones are tracked by a high-water mark.
+            params["orderby"] = "id"
+            params["order"] = "asc"
+        if self.is_modified_filtered(context):
+            start_value = self.get_starting_replication_key_value(context)
+            if start_value:
+                params["modified_after"] = get_modified_after(start_value)
+        if context and "id_window" in context:
+            first_id, last_id = context["id_window"]
+            params["include"] = ",".join(map(str, range(first_id, last_id + 1)))
+            params["orderby"] = "id"
         return params
+
+    def is_modified_filtered(self, context: Optional[dict]) -> bool:
+        """Return True if only records modified since the last sync are requested.
+
+        Top-level post type streams filter by their `modified_gmt` replication
+        key, unless their child streams need every parent record, or they are
+        scoped to course steps, which are listed in full to find new ones.
+        """
+        return (
+            self.replication_key == "modified_gmt"
+            and not self.parent_stream_type
+            and not self.has_selected_descendents
+            and not self.is_course_scoped(context)
+        )
+
+    def check_runtime_budget(self) -> None:
+        """Raise `RuntimeBudgetExhausted` once the tap's deadline has passed."""
+        deadline = self.tap.deadline
+        if deadline is not None and time.monotonic() >= deadline:
+            raise RuntimeBudgetExhausted(
+                f"Runtime budget exhausted while syncing '{self.name}'."
+            )
+
+    def get_synced_partitions(self, context: Optional[dict]) -> PartitionWatermark:
+        """Return the ids of the partitions finished in the current sync cycle.
+
+        A sync cycle only spans runs when a run stopped partway through the
+        stream, in which case the partitions it already finished are skipped.
+        """
+        site_id = self.get_site_context(context).get("site_id")
+        with self.tap.state_lock:
+            if site_id not in self._synced_partitions:
+                state = self.get_context_state(context)
+                self._synced_partitions[site_id] = PartitionWatermark.decode(
+                    state.get("synced_partitions")
+                )
+            return self._synced_partitions[site_id]
+
+    def start_synced_partition(self, context: dict, partition_id: int) -> None:
+        """Record that a partition has started syncing."""
+        with self.tap.state_lock:
+            self.get_synced_partitions(context).start(partition_id)
+
+    def add_synced_partition(self, context: dict, partition_id: int) -> None:
+        """Record a finished partition in the state."""
+        with self.tap.state_lock:
+            synced_partitions = self.get_synced_partitions(context)
+            synced_partitions.finish(partition_id)
+            state = self.get_context_state(context)
+            state["synced_partitions"] = synced_partitions.encode()
+
+    def sync(self, context: Optional[dict] = None) -> None:
+        """Sync this stream, skipping child partitions finished by an earlier run."""
+        self.check_runtime_budget()
+        partition_id = None
+        if context and self.partition_key:
+            partition_id = context.get(self.partition_key)
+        if partition_id in self.get_synced_partitions(context):
+            self.logger.info(
+                f"Skipping '{self.name}' partition {context}, "
+                "already synced in the current cycle."
+            )
+            return
+        if partition_id is not None:
+            self.start_synced_partition(cast(dict, context), partition_id)
+        super().sync(context)
+        if partition_id is not None:
+            self.add_synced_partition(cast(dict, context), partition_id)
+            if self.tap.progress:
+                self.tap.progress.advance(self.name)
+
+    def reset_caches(self) -> None:
+        """Drop data cached for the current sync cycle."""
+
+    def mark_synced(self, synced_at: str, context: Optional[dict] = None) -> None:
+        """Record a completed sync of this stream and its child streams."""
+        site_id = self.get_site_context(context).get("site_id")
+        with self.tap.state_lock:
+            state = self.get_context_state(context)
+            state["last_synced_at"] = synced_at
+            state.pop("synced_partitions", None)
+            ResumeCursor(state).clear()
+            self._synced_partitions.pop(site_id, None)
+        for child_stream in self.child_streams:
+            cast(LearnDashStream, child_stream).mark_synced(synced_at, context)
+
+    def mark_interrupted(
+        self, interrupted_at: str, context: Optional[dict] = None
+    ) -> None:
+        """Record that the runtime budget ran out while syncing this stream.
+
+        Records are synced in id order rather than replication key order, so
+        the progress markers of the partial sync are dropped. The next run then
+        resumes with the same replication key value and filter. Records behind
+        the resume cursor may be modified before the sync completes, so the
+        start of the first interrupted cycle is kept as `resume_signpost`,
+        capping the replication key value the completed sync may reach.
+        """
+        with self.tap.state_lock:
+            state = self.get_context_state(context)
+            state["interrupted_at"] = interrupted_at
+            state.setdefault("resume_signpost", self.tap.cycle_started_at or utc_now())
+            state.pop("progress_markers", None)
+
+    def get_replication_key_signpost(self, context: Optional[dict]) -> Optional[Any]:
+        """Return the signpost capping the replication key value of this sync.
+
+        A sync resuming an interrupted one is capped at the interrupted sync's
+        start, so edits behind its resume cursor are read again by the next one.
+        """
+        signpost = super().get_replication_key_signpost(context)
+        resume_signpost = self.get_context_state(context).get("resume_signpost")
+        if signpost is None or not resume_signpost:
+            return signpost
+        return min(signpost, parse_utc(resume_signpost))
+
+    def get_resume_cursor(self, context: Optional[dict]) -> ResumeCursor:
+        """Return the resume cursor kept in the state of a top-level stream.
+
+        Child streams are resumed by their finished partitions instead, so they
+        get a cursor that is not kept.
+        """
+        if self.parent_stream_type:
+            return ResumeCursor({})
+        return ResumeCursor(self.get_context_state(context))
+
+    def request_probe(
+        self, context: Optional[dict], params: Dict[str, Any]
+    ) -> requests.Response:
+        """Request a single record of the endpoint, with extra URL parameters."""
+        return self.request_with_params(
+            context, {"per_page": 1, "_fields": "id", **params}
+        )
+
+    def request_with_params(
+        self, context: Optional[dict], params: Dict[str, Any]
+    ) -> requests.Response:
+        """Request the first page of the endpoint, with extra URL parameters."""
+        self.check_runtime_budget()
+        params = {**self.get_url_params(context, None), **params}
+        request = self.requests_session.prepare_request(
+            requests.Request(
+                "GET", self.get_url(context), params=params, headers=self.http_headers
+            )
+        )
+        self.authenticate(request, context)
+        return self.request_decorator(self._request)(request, context)
+
+    def request_total(self, context: Optional[dict]) -> int:
+        """Return the record count the endpoint reports in `X-WP-Total`."""
+        response = self.request_probe(context, {})
+        return int(response.headers.get("X-WP-Total", 0))
+
+    def estimate_work(self, context: Optional[dict]) -> Tuple[int, int]:
+        """Return the expected records and requests of a sync of this stream.
+
+        Course-scoped streams are estimated from the configured courses' steps,
+        which are cached for the sync, rather than the global post type.
+        """
+        if self.is_course_scoped(context):
+            total = len(self.get_course_step_ids(context))
+            return total, math.ceil(total / self._max_page_size)
+        total = self.request_total(context)
+        return total, math.ceil(total / self._page_size)
+
+    def request_id_bound(
+        self, context: Optional[dict], order: str
+    ) -> Tuple[Optional[int], int]:
+        """Return the lowest (`order="asc"`) or highest (`"desc"`) record id.
+
+        The record count reported in `X-WP-Total` is returned with it.
+        """
+        response = self.request_probe(context, {"orderby": "id", "order": order})
+        rows = response.json()
+        total = int(response.headers.get("X-WP-Total", 0))
+        return (rows[0]["id"] if rows else None), total
+
+    def get_id_windows(
+        self, context: Optional[dict], after_id: Optional[int] = None
+    ) -> List[dict]:
+        """Split the endpoint's id range into contexts of id windows.
+
+        Windows are sized to hold about `slice_window_size` records each. With
+        `after_id` set, only ids above it are covered.
+        """
+        first_id, total = self.request_id_bound(context, "asc")
+        last_id, _ = self.request_id_bound(context, "desc")
+        if first_id is None or last_id is None:
+            return []
+        windows = plan_id_windows(
+            first_id,
+            last_id,
+            total,
+            int(self.config.get("slice_window_size", self._max_page_size)),
+            self._max_include_ids,
+        )
+        if after_id is not None:
+            windows = [
+                (max(start, after_id + 1), end)
+                for start, end in windows
+                if end > after_id
+            ]
+        return [
+            {**(context or {}), "id_window": [start, end]} for start, end in windows
+        ]
+
+    def request_window(self, window_context: dict) -> List[requests.Response]:
+        """Request all pages of an id window."""
+        return list(self.request_pages(window_context, concurrent=False))
+
+    def request_sliced_pages(
+        self, context: Optional[dict], after_id: Optional[int] = None
+    ) -> Iterator[requests.Response]:
+        """Request the endpoint window by window, yielding responses in order.
+
+        WordPress turns `page=N` into an SQL `OFFSET`, so deep pages get slower.
+        Restricting each request to a window of ids with `include` keeps every
+        page shallow. Up to `page_workers` windows are requested concurrently.
+        """
+        for responses in ordered_map(
+            cast(Executor, self.tap.fetch_executor),
+            self.request_window,
+            self.get_id_windows(context, after_id),
+            self.page_workers,
+        ):
+            yield from responses
+
+    def request_ids(
+        self, context: Optional[dict], params: Optional[Dict[str, Any]] = None
+    ) -> Iterator[int]:
+        """Request only the ids of the endpoint's records, at the maximum page size.
+
+        Extra URL parameters may be given; a value of None removes a parameter.
+        """
+        page = 1
+        while True:
+            page_params = {
+                **(params or {}),
+                "_fields": "id",
+                "per_page": self._max_page_size,
+                "page": page,
+            }
+            response = self.request_with_params(context, page_params)
+            for row in self.parse_response(response):
+                yield row["id"]
+            if page >= int(response.headers.get("X-WP-TotalPages", 1)):
+                return
+            page += 1
+
+    def request_included(
+        self, context: Optional[dict], ids: List[int], fields: Optional[str] = None
+    ) -> Iterator[dict]:
+        """Request the records with the given ids in order, optionally some fields."""
+        for start in range(0, len(ids), self._max_page_size):
+            batch = ids[start:start + self._max_page_size]
+            params: Dict[str, Any] = {
+                "include": ",".join(map(str, batch)),
+                "orderby": "include",
+                "per_page": len(batch),
+            }
+            if fields:
+                params["_fields"] = fields
+            yield from self.parse_response(self.request_with_params(context, params))
+
+    def get_course_step_ids(self, context: Optional[dict]) -> List[int]:
+        """Return the ids of this stream's steps in the site's configured courses."""
+        course_steps_stream: Any = self.tap.streams["course_steps"]
+        step_ids = set()
+        for course_id in self.get_course_ids(context):
+            course_context = {**self.get_site_context(context), "course_id": course_id}
+            for step in course_steps_stream.get_steps(course_context):
+                if step["step_type"] == self.step_type:
+                    step_ids.add(step["step_id"])
+        return sorted(step_ids)
+
+    def request_changed_steps(self, context: Optional[dict]) -> Iterator[dict]:
+        """Request the full bodies of course steps that changed since the last sync.
+
+        Steps are first listed with only `id` and `modified_gmt`. A step is
+        requested in full if it is new, or not modified before the stream's
+        `modified_gmt` replication key value. Changed steps are requested in
+        `modified_gmt` order, so a sync cut short by the runtime budget leaves
+        a replication key value no later than any step it missed.
+        """
+        step_ids = self.get_course_step_ids(context)
+        state = self.get_context_state(context)
+        known_ids = IdRangeSet.decode(state.get("known_step_ids"))
+        modified_high_water = self.get_starting_replication_key_value(context) or ""
+        changed_steps = [
+            row
+            for row in self.request_included(context, step_ids, "id,modified_gmt")
+            if row["id"] not in known_ids or row["modified_gmt"] >= modified_high_water
+        ]
+        changed_steps.sort(key=lambda row: row["modified_gmt"])
+        self.logger.info(
+            f"{len(changed_steps)} of {len(step_ids)} '{self.name}' steps changed."
+        )
+        yield from self.request_included(
+            context, [row["id"] for row in changed_steps]
+        )
+        with self.tap.state_lock:
+            for step_id in step_ids:
+                known_ids.add(step_id)
+            state["known_step_ids"] = known_ids.encode()
+
+    def request_page(
+        self, context: Optional[dict], next_page_token: Optional[Any]
+    ) -> requests.Response:
+        """Request a single page."""
+        self.check_runtime_budget()
+        prepared_request = self.prepare_request(
+            context, next_page_token=next_page_token
+        )
+        return self.request_decorator(self._request)(prepared_request, context)
+
+    def request_pages(
+        self, context: Optional[dict], concurrent: bool = True, first_page: int = 1
+    ) -> Iterator[requests.Response]:
+        """Request pages from `first_page` one after another, yielding each response.
+
+        The next page token is derived from the response headers, so the request
+        for page N+1 can go out as soon as page N has been received. When the
+        work plan gives the stream several workers and `concurrent` is set, the
+        pages after the first are requested concurrently instead, up to that
+        many at a time.
+        """
+        next_page_token: Any = first_page if first_page > 1 else None
+        while True:
+            response = self.request_page(context, next_page_token)
+            previous_token = copy.deepcopy(next_page_token)
+            next_page_token = self.get_next_page_token(
+                response=response, previous_token=previous_token
+            )
+            if next_page_token and next_page_token == previous_token:
+                raise RuntimeError(
+                    f"Loop detected in pagination. "
+                    f"Pagination token {next_page_token} is identical to prior token."
+                )
+            yield response
+            if not next_page_token:
+                return
+            if concurrent and self.page_workers > 1:
+                total_pages = int(response.headers.get("X-WP-TotalPages", 1))
+                yield from ordered_map(
+                    cast(Executor, self.tap.fetch_executor),
+                    lambda page: self.request_page(context, page),
+                    range(next_page_token, total_pages + 1),
+                    self.page_workers,
+                )
+                return
+
+    def prefetch_pages(
+        self, pages: Iterable[requests.Response]
+    ) -> Iterator[requests.Response]:
+        """Yield pages, prefetching the ones after the first in a background thread.
+
+        Child partitions are mostly a single page with nothing to overlap, so
+        their pages are only prefetched if the first reports more pages.
+        """
+        pages = iter(pages)
+        first_response = next(pages, None)
+        if first_response is None:
+            return
+        yield first_response
+        total_pages = int(first_response.headers.get("X-WP-TotalPages", 1))
+        if self.parent_stream_type and total_pages <= 1:
+            yield from pages
+            return
+        yield from prefetch(pages, self.prefetch_depth)
+
+    def request_records(self, context: Optional[dict]) -> Iterable[dict]:
+        """Request records from REST endpoint(s), returning response records.
+
+        With `prefetch_depth` set, pages are requested by a background thread
+        through a bounded queue while earlier pages are parsed and written, see
+        `prefetch_pages`.
+        Top-level streams move a resume cursor past every written record, and
+        continue from it if the previous run ran out of runtime budget.
+        """
+        if self.is_course_scoped(context):
+            yield from self.request_changed_steps(context)
+            return
+        cursor = self.get_resume_cursor(context)
+        first_page = 1
+        pages: Iterable[requests.Response]
+        if self.is_sliced:
+            pages = self.request_sliced_pages(context, cursor.after_id)
+        else:
+            first_page = cursor.first_page
+            pages = self.request_pages(context, first_page=first_page)
+        if self.prefetch_depth > 0:
+            pages = self.prefetch_pages(pages)
+        for page, response in enumerate(pages, start=first_page):
+            for row in cursor.skip_synced(self.parse_response(response)):
+                yield row
+                if not self.parent_stream_type:
+                    # The generator resumes only once the row has been written.
+                    with self.tap.state_lock:
+                        cursor.advance(page, row["id"])
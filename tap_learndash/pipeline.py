@@ -0,0 +1,99 @@
+"""Helpers that overlap HTTP requests with record processing."""
+
+import bisect
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+_PREFETCH_DONE = object()
+
+
+class _Prefetcher:
+    """Producer thread filling a bounded queue with `(item, error)` pairs."""
+
+    def __init__(self, items: Iterable[Any], depth: int) -> None:
+        self.items = items
+        self.buffer: queue.Queue = queue.Queue(maxsize=depth)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(
+            target=self.produce, name="ld-prefetch", daemon=True
+        )
+
+    def put(self, item: Any, error: Any = None) -> bool:
+        """Queue an item, returning False if the consumer stopped first."""
+        while not self.stop.is_set():
+            try:
+                self.buffer.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(self) -> None:
+        """Iterate the items into the queue, forwarding any error."""
+        try:
+            for item in self.items:
+                if not self.put(item):
+                    return
+        except BaseException as ex:  # forwarded to the consumer
+            self.put(None, ex)
+            return
+        self.put(_PREFETCH_DONE)
+
+
+def prefetch(items: Iterable[Any], depth: int) -> Iterator[Any]:
+    """Iterate `items` in a background thread, buffering at most `depth` ahead.
+
+    Exceptions raised by the producer are re-raised in the consuming thread. If
+    the consumer stops early, the producer is told to stop at its next item.
+    """
+    prefetcher = _Prefetcher(items, depth)
+    prefetcher.thread.start()
+    try:
+        while True:
+            item, error = prefetcher.buffer.get()
+            if error is not None:
+                raise error
+            if item is _PREFETCH_DONE:
+                return
+            yield item
+    finally:
+        prefetcher.stop.set()
+
+
+class Lookahead:
+    """Requests for upcoming keys, submitted to an executor ahead of their use.
+
+    Keys are visited in ascending order. Visiting a key submits `func` for the
+    next `depth` wanted keys from it on, cancels the requests of wanted keys
+    that were passed over, and hands out the visited key's request, if any.
+    """
+
+    def __init__(self, executor: Executor, func: Callable[[int], Any]) -> None:
+        """Initialize the lookahead to submit `func(key)` calls to `executor`."""
+        self.executor = executor
+        self.func = func
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+
+    def visit(self, key: int, wanted_keys: List[int], depth: int) -> Optional[Future]:
+        """Return the request of `key`, or None if `key` is not in `wanted_keys`.
+
+        `wanted_keys` must be sorted.
+        """
+        index = bisect.bisect_left(wanted_keys, key)
+        with self._lock:
+            for stale_key in [key_ for key_ in self._pending if key_ < key]:
+                self._pending.pop(stale_key).cancel()
+            for next_key in wanted_keys[index:index + depth]:
+                if next_key not in self._pending:
+                    self._pending[next_key] = self.executor.submit(self.func, next_key)
+            return self._pending.pop(key, None)
+
+    def cancel(self) -> None:
+        """Cancel all requests submitted ahead."""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
@@ -0,0 +1,132 @@
+"""Pre-flight work planning and progress reporting."""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class WorkPlan:
+    """Expected amount of work per stream, estimated before the sync starts.
+
+    Top-level streams are measured in records, from the `X-WP-Total` header.
+    Child streams are measured in partitions, one per parent record.
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty plan."""
+        self.totals: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+        self.levels: Dict[str, int] = {}
+
+    def add(self, stream_name: str, total: int, requests: int, level: int = 0) -> None:
+        """Add expected work units and requests for a stream.
+
+        `level` is the stream's depth below the top-level streams; streams only
+        compete for workers with other streams at the same level.
+        """
+        self.totals[stream_name] = self.totals.get(stream_name, 0) + total
+        self.requests[stream_name] = self.requests.get(stream_name, 0) + requests
+        self.levels[stream_name] = level
+
+    def workers_for(self, stream_name: str, max_workers: int) -> int:
+        """Return a stream's share of `max_workers`, by its share of requests."""
+        level = self.levels.get(stream_name)
+        level_requests = sum(
+            requests
+            for name, requests in self.requests.items()
+            if self.levels[name] == level
+        )
+        if not level_requests:
+            return 1
+        share = self.requests[stream_name] / level_requests
+        return max(1, round(max_workers * share))
+
+    def log_summary(self, logger: logging.Logger, max_workers: int) -> None:
+        """Log the expected work of each stream."""
+        for stream_name, total in self.totals.items():
+            logger.info(
+                f"Plan for '{stream_name}': {total} expected, "
+                f"~{self.requests[stream_name]} requests, "
+                f"{self.workers_for(stream_name, max_workers)} workers."
+            )
+
+
+class ProgressReporter:
+    """Log progress, throughput and ETA of each stream against a work plan."""
+
+    def __init__(
+        self, plan: WorkPlan, logger: logging.Logger, interval: float = 30
+    ) -> None:
+        """Initialize the reporter to log at most every `interval` seconds."""
+        self.plan = plan
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._done: Dict[str, int] = {}
+        self._started: Dict[str, float] = {}
+        self._last_report = time.monotonic()
+
+    def reset(self) -> None:
+        """Forget all progress, e.g. before another sync cycle."""
+        with self._lock:
+            self._done.clear()
+            self._started.clear()
+
+    def advance(self, stream_name: str, count: int = 1) -> None:
+        """Count finished work units and report if the interval has passed."""
+        now = time.monotonic()
+        with self._lock:
+            self._started.setdefault(stream_name, now)
+            self._done[stream_name] = self._done.get(stream_name, 0) + count
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def _eta(self, stream_name: str, now: float) -> Optional[float]:
+        """Return the estimated seconds left for a stream, if it can be known."""
+        done = self._done.get(stream_name, 0)
+        total = self.plan.totals.get(stream_name)
+        elapsed = now - self._started.get(stream_name, now)
+        if not total or not done or not elapsed:
+            return None
+        return max(total - done, 0) / (done / elapsed)
+
+    def report(self) -> None:
+        """Log the progress of every stream that has started."""
+        now = time.monotonic()
+        with self._lock:
+            for stream_name, done in self._done.items():
+                total = self.plan.totals.get(stream_name)
+                elapsed = now - self._started[stream_name]
+                rate = done / elapsed if elapsed else 0.0
+                eta = self._eta(stream_name, now)
+                progress = f"{done}/{total}" if total else f"{done}"
+                eta_text = f", ETA {math.ceil(eta)}s" if eta is not None else ""
+                self.logger.info(
+                    f"Progress of '{stream_name}': {progress} "
+                    f"({rate:.1f}/s){eta_text}"
+                )
+
+
+def plan_id_windows(
+    first_id: int, last_id: int, total: int, window_size: int, max_span: int
+) -> List[Tuple[int, int]]:
+    """Split `[first_id, last_id]` into windows expected to hold `window_size` records.
+
+    WordPress post types share one id sequence, so a stream's `total` records
+    are spread thinly over its id range. Each window spans as many ids as hold
+    `window_size` records at that density, but at most `max_span` ids, because
+    a window lists all its ids in the request URL.
+    """
+    id_count = last_id - first_id + 1
+    if total <= 0 or id_count <= 0:
+        return []
+    density = min(total, id_count) / id_count
+    span = max(min(math.ceil(window_size / density), max_span), 1)
+    return [
+        (start, min(start + span - 1, last_id))
+        for start in range(first_id, last_id + 1, span)
+    ]
@@ -0,0 +1,93 @@
+"""Per-stream profiling for tap-learndash."""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from types import FrameType
+from typing import Iterator, Optional
+
+SUMMARY_LIMIT = 25
+
+
+class StackSampler:
+    """Periodically sample one thread's call stack into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        """Initialize the sampler for a thread, sampling every `interval` seconds."""
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="ld-stack-sampler", daemon=True
+        )
+
+    @staticmethod
+    def _collapse(frame: Optional[FrameType]) -> str:
+        """Return the stack ending at `frame` as a root-first collapsed line."""
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            filename = os.path.basename(code.co_filename)
+            labels.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[self._collapse(frame)] += 1
+
+    def start(self) -> None:
+        """Start sampling in a background thread."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread to exit."""
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: Path) -> None:
+        """Write the samples in the collapsed-stack format used by flamegraph.pl."""
+        with open(path, "w") as collapsed_file:
+            for stack, count in self.counts.most_common():
+                collapsed_file.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_stream(
+    stream_name: str, output_dir: Path, logger: logging.Logger
+) -> Iterator[None]:
+    """Profile the calling thread while a stream syncs.
+
+    Writes `<stream_name>.pstats`, `<stream_name>.collapsed` and a
+    `<stream_name>.txt` summary of the top functions by cumulative time.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        profiler.dump_stats(str(output_dir / f"{stream_name}.pstats"))
+        sampler.write(output_dir / f"{stream_name}.collapsed")
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats("cumulative").print_stats(SUMMARY_LIMIT)
+        (output_dir / f"{stream_name}.txt").write_text(summary.getvalue())
+        logger.info(
+            f"Wrote profile for '{stream_name}' to {output_dir}, "
+            f"top functions in {stream_name}.txt"
+        )
@@ -0,0 +1,29 @@
+"""Request rate limiting shared by all streams and sites."""
+
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Space out calls so that at most `rate` of them start each second.
+
+    The limiter is shared across threads; a rate of None or 0 disables it.
+    """
+
+    def __init__(self, rate: Optional[float]) -> None:
+        """Initialize the limiter for `rate` calls per second."""
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self) -> None:
+        """Block until the caller may send its next request."""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
@@ -0,0 +1,189 @@
+"""Compact encodings and cursors kept in tap state."""
+
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+class IdRangeSet:
+    """A set of integer ids held as sorted, non-adjacent `[start, end]` ranges.
+
+    Encoded as e.g. `"1-500,502,510-900"`, so the size of the encoding depends
+    on how fragmented the ids are rather than on how many there are.
+    """
+
+    def __init__(self, ids: Optional[Iterable[int]] = None) -> None:
+        """Initialize the set, adding `ids` if given."""
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        for id_ in ids or []:
+            self.add(id_)
+
+    @classmethod
+    def decode(cls, text: Optional[str]) -> "IdRangeSet":
+        """Return the set encoded by `text`."""
+        id_set = cls()
+        for part in (text or "").split(","):
+            if not part:
+                continue
+            start, _, end = part.partition("-")
+            id_set._starts.append(int(start))
+            id_set._ends.append(int(end or start))
+        return id_set
+
+    def encode(self) -> str:
+        """Return the compact string encoding of the set."""
+        return ",".join(
+            str(start) if start == end else f"{start}-{end}"
+            for start, end in zip(self._starts, self._ends)
+        )
+
+    def _find(self, id_: int) -> int:
+        """Return the index of the last range starting at or before `id_`."""
+        return bisect_right(self._starts, id_) - 1
+
+    def __contains__(self, id_: object) -> bool:
+        if not isinstance(id_, int):
+            return False
+        index = self._find(id_)
+        return index >= 0 and self._ends[index] >= id_
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in zip(self._starts, self._ends):
+            yield from range(start, end + 1)
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in zip(self._starts, self._ends))
+
+    def add(self, id_: int) -> None:
+        """Add an id, merging it into adjacent ranges."""
+        index = self._find(id_)
+        if index >= 0 and self._ends[index] >= id_:
+            return
+        joins_left = index >= 0 and self._ends[index] == id_ - 1
+        joins_right = (
+            index + 1 < len(self._starts) and self._starts[index + 1] == id_ + 1
+        )
+        if joins_left and joins_right:
+            self._ends[index] = self._ends.pop(index + 1)
+            self._starts.pop(index + 1)
+        elif joins_left:
+            self._ends[index] = id_
+        elif joins_right:
+            self._starts[index + 1] = id_
+        else:
+            self._starts.insert(index + 1, id_)
+            self._ends.insert(index + 1, id_)
+
+
+class PartitionWatermark:
+    """Finished partition ids, as a high-water mark plus the ids finished above it.
+
+    Partitions are started in ascending id order, so every started partition
+    up to the mark has finished. Ids that finish while a lower partition is
+    still running are kept as exceptions until the mark passes them. The state
+    encoding therefore stays the same size however many partitions finish.
+    """
+
+    def __init__(
+        self, through_id: Optional[int] = None, exceptions: Iterable[int] = ()
+    ) -> None:
+        """Initialize the mark and exceptions, e.g. as decoded from state."""
+        self.through_id = through_id
+        self.exceptions = set(exceptions)
+        self._running: Set[int] = set()
+
+    @classmethod
+    def decode(cls, encoded: Optional[dict]) -> "PartitionWatermark":
+        """Return the watermark encoded by `encoded`."""
+        encoded = encoded or {}
+        return cls(encoded.get("through_id"), encoded.get("exceptions", []))
+
+    def encode(self) -> dict:
+        """Return the state encoding of the watermark."""
+        encoded: Dict[str, Any] = {"through_id": self.through_id}
+        if self.exceptions:
+            encoded["exceptions"] = sorted(self.exceptions)
+        return encoded
+
+    def __contains__(self, id_: object) -> bool:
+        if not isinstance(id_, int):
+            return False
+        if self.through_id is not None and id_ <= self.through_id:
+            return True
+        return id_ in self.exceptions
+
+    def start(self, id_: int) -> None:
+        """Record that a partition has started syncing."""
+        self._running.add(id_)
+
+    def finish(self, id_: int) -> None:
+        """Record a finished partition, moving the mark up where possible."""
+        self._running.discard(id_)
+        self.exceptions.add(id_)
+        floor = min(self._running, default=None)
+        passed = [
+            exception for exception in self.exceptions
+            if floor is None or exception < floor
+        ]
+        if passed:
+            if self.through_id is not None:
+                passed.append(self.through_id)
+            self.through_id = max(passed)
+            self.exceptions.difference_update(passed)
+
+
+class ResumeCursor:
+    """Position of a top-level stream's sync, kept in its state between runs.
+
+    Records are synced in id order, so the cursor holds the id of the last
+    written record and the page it came from. A run that resumes re-requests
+    that page and the one before it, so up to a page of deletions ahead of the
+    cursor cannot shift unsynced records out of reach, and skips the records
+    it already wrote.
+    """
+
+    def __init__(self, state: dict) -> None:
+        """Initialize the cursor on the writeable state of a stream partition."""
+        self.state = state
+
+    @property
+    def first_page(self) -> int:
+        """Return the page to resume from."""
+        return max(self.state.get("resume_page", 1) - 1, 1)
+
+    @property
+    def after_id(self) -> Optional[int]:
+        """Return the id of the last record written, if the sync was interrupted."""
+        return self.state.get("resume_after_id")
+
+    def advance(self, page: int, record_id: int) -> None:
+        """Move the cursor past a written record."""
+        self.state["resume_page"] = page
+        self.state["resume_after_id"] = record_id
+
+    def skip_synced(self, rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield the rows not yet written by an interrupted sync."""
+        after_id = self.after_id
+        for row in rows:
+            if after_id is None or row["id"] > after_id:
+                yield row
+
+    def clear(self) -> None:
+        """Forget the cursor once the stream has been synced completely."""
+        for key in (
+            "resume_page", "resume_after_id", "resume_signpost", "interrupted_at"
+        ):
+            self.state.pop(key, None)
+
+
+def sync_priority(state: dict) -> Tuple[bool, str]:
+    """Return a sort key putting the streams most due for a sync first.
+
+    Streams are ordered least recently synced first, but streams interrupted by
+    the runtime budget go behind all others, in the order they were
+    interrupted, so one long stream cannot starve the rest across runs.
+    """
+    interrupted_at = state.get("interrupted_at")
+    if interrupted_at:
+        return True, interrupted_at
+    return False, state.get("last_synced_at", "")
@@ -1,12 +1,16 @@
 """Stream type classes for tap-learndash."""
 
+import threading
+import time
 import requests
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Any, Dict, Optional, Union, List, Iterable
+from typing import Any, Dict, Optional, Union, List, Iterable, Iterator, Tuple, cast
 
 from singer_sdk import typing as th  # JSON Schema typing helpers
 
-from tap_learndash.client import LearnDashStream
+from tap_learndash.client import LearnDashStream, ordered_map
+from tap_learndash.pipeline import Lookahead
 
 
 class CoursesStream(LearnDashStream):
@@ -14,6 +18,7 @@ class CoursesStream(LearnDashStream):
     name = "courses"
     path = "/sfwd-courses"
     primary_keys = ["id"]
+    replication_key = "modified_gmt"
     schema = th.PropertiesList(
         th.Property("date", th.DateTimeType),
         th.Property("date_gmt", th.DateTimeType),
@@ -68,9 +73,41 @@ class CoursesStream(LearnDashStream):
         th.Property("expire_access_delete_progress", th.BooleanType)
     ).to_dict()
 
+    def get_url_params(
+        self, context: Optional[dict], next_page_token: Optional[Any]
+    ) -> Dict[str, Any]:
+        """Return URL parameters, limited to the site's `course_ids` if any.
+
+        In an id window of a sliced sync, only the course ids in the window are
+        included.
+        """
+        params = super().get_url_params(context, next_page_token)
+        course_ids = self.get_window_course_ids(context)
+        if course_ids:
+            params["include"] = ",".join(map(str, course_ids))
+        return params
+
+    def get_window_course_ids(self, context: Optional[dict]) -> List[int]:
+        """Return the site's `course_ids` within the context's id window, if any."""
+        course_ids = self.get_course_ids(context)
+        if context and "id_window" in context:
+            first_id, last_id = context["id_window"]
+            course_ids = [id_ for id_ in course_ids if first_id <= id_ <= last_id]
+        return course_ids
+
+    def get_id_windows(
+        self, context: Optional[dict], after_id: Optional[int] = None
+    ) -> List[dict]:
+        """Return the id windows of a sliced sync holding any configured course."""
+        windows = super().get_id_windows(context, after_id)
+        if not self.get_course_ids(context):
+            return windows
+        return [window for window in windows if self.get_window_course_ids(window)]
+
     def get_child_context(self, record: dict, context: Optional[dict]) -> dict:
         """Return a context dictionary for child streams."""
         return {
+            **self.get_site_context(context),
             "course_id": record["id"]
         }
 
@@ -80,6 +117,7 @@ class UsersStream(LearnDashStream):
     name = "users"
     path = "/users?context=edit"
     primary_keys = ["id"]
+    api_path = "/wp-json/wp/v2"
     schema = th.PropertiesList(
         th.Property("id", th.IntegerType),
         th.Property("username", th.StringType),
@@ -103,14 +141,10 @@ class UsersStream(LearnDashStream):
         th.Property("meta", th.ArrayType(th.StringType))
     ).to_dict()
 
-    @property
-    def url_base(self) -> str:
-        """Return the API URL root, configurable via tap settings."""
-        return self.config["api_url"] + "/wp-json/wp/v2"
-
     def get_child_context(self, record: dict, context: Optional[dict]) -> dict:
         """Return a context dictionary for child streams."""
         return {
+            **self.get_site_context(context),
             "user_id": record["id"]
         }
 
@@ -122,6 +156,7 @@ class CoursePrerequisitesStream(LearnDashStream):
     primary_keys = ["course_id", "id"]
     parent_stream_type = CoursesStream
     ignore_parent_replication_keys = True
+    partition_key = "course_id"
     schema = th.PropertiesList(
         th.Property("course_id", th.IntegerType),
         th.Property("id", th.IntegerType),
@@ -161,6 +196,7 @@ class CourseUsersStream(LearnDashStream):
     primary_keys = ["course_id", "id"]
     parent_stream_type = CoursesStream
     ignore_parent_replication_keys = True
+    partition_key = "course_id"
     schema = th.PropertiesList(
         th.Property("course_id", th.IntegerType),
         th.Property("id", th.IntegerType),
@@ -180,6 +216,7 @@ class CourseUsersStream(LearnDashStream):
     def get_child_context(self, record: dict, context: Optional[dict]) -> dict:
         """Return a context dictionary for child streams."""
         return {
+            **self.get_site_context(context),
             "user_id": record["id"]
         }
 
@@ -196,6 +233,7 @@ class CourseGroupsStream(LearnDashStream):
     primary_keys = ["course_id", "id"]
     parent_stream_type = CoursesStream
     ignore_parent_replication_keys = True
+    partition_key = "course_id"
     schema = th.PropertiesList(
         th.Property("course_id", th.IntegerType),
         th.Property("id", th.IntegerType),
@@ -212,11 +250,96 @@ class CourseGroupsStream(LearnDashStream):
     ).to_dict()
 
 
+def flatten_course_steps(
+    hierarchy: Any, parent_step_id: Optional[int] = None
+) -> Iterator[dict]:
+    """Flatten a nested `{post_type: {step_id: children}}` steps hierarchy."""
+    if not isinstance(hierarchy, dict):
+        # PHP encodes empty maps as empty lists.
+        return
+    step_order = 0
+    for step_type, steps in hierarchy.items():
+        if not isinstance(steps, dict):
+            continue
+        for step_id, children in steps.items():
+            yield {
+                "step_id": int(step_id),
+                "step_type": step_type,
+                "parent_step_id": parent_step_id,
+                "step_order": step_order
+            }
+            step_order += 1
+            yield from flatten_course_steps(children, int(step_id))
+
+
+class CourseStepsStream(LearnDashStream):
+    """Defines the course > lesson > topic > quiz hierarchy of a course."""
+    name = "course_steps"
+    path = "/sfwd-courses/{course_id}/steps"
+    primary_keys = ["course_id", "step_id"]
+    parent_stream_type = CoursesStream
+    ignore_parent_replication_keys = True
+    partition_key = "course_id"
+    schema = th.PropertiesList(
+        th.Property("course_id", th.IntegerType),
+        th.Property("step_id", th.IntegerType),
+        th.Property("step_type", th.StringType),
+        th.Property("parent_step_id", th.IntegerType),
+        th.Property("step_order", th.IntegerType)
+    ).to_dict()
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Initialize the stream and its cache of course steps."""
+        super().__init__(*args, **kwargs)
+        self._steps: Dict[Tuple[Optional[str], int], Tuple[float, List[dict]]] = {}
+        self._steps_lock = threading.Lock()
+
+    @property
+    def steps_max_age(self) -> float:
+        """Return the seconds cached steps stay fresh: the courses poll interval.
+
+        In daemon mode the steps cache thereby stays warm between sync cycles.
+        """
+        return self.tap.get_poll_interval("courses")
+
+    def get_url_params(
+        self, context: Optional[dict], next_page_token: Optional[Any]
+    ) -> Dict[str, Any]:
+        """Request the steps as a hierarchy."""
+        return {"type": "h"}
+
+    def get_steps(self, context: dict) -> List[dict]:
+        """Return the flattened steps of a course, cached for `steps_max_age`."""
+        key = (context.get("site_id"), context["course_id"])
+        with self._steps_lock:
+            fetched_at, steps = self._steps.get(key, (None, []))
+        is_fresh = (
+            fetched_at is not None
+            and time.monotonic() - fetched_at < self.steps_max_age
+        )
+        if is_fresh:
+            return steps
+        fetched_at = time.monotonic()
+        hierarchy = self.request_page(context, None).json()
+        if isinstance(hierarchy, dict) and "h" in hierarchy:
+            hierarchy = hierarchy["h"]
+        steps = list(flatten_course_steps(hierarchy))
+        with self._steps_lock:
+            self._steps[key] = (fetched_at, steps)
+        return steps
+
+    def request_records(self, context: Optional[dict]) -> Iterable[dict]:
+        """Return the steps of the context's course."""
+        for step in self.get_steps(cast(dict, context)):
+            yield dict(step)
+
+
 class AssignmentsStream(LearnDashStream):
     """Defines all the fields that exist within a assignment record."""
     name = "assignments"
     path = "/sfwd-assignment"
     primary_keys = ["id"]
+    replication_key = "modified_gmt"
     schema = th.PropertiesList(
         th.Property("id", th.IntegerType),
         th.Property("date", th.DateTimeType),
@@ -252,6 +375,7 @@ class EssaysStream(LearnDashStream):
     name = "essays"
     path = "/sfwd-essays"
     primary_keys = ["id"]
+    replication_key = "modified_gmt"
     schema = th.PropertiesList(
         th.Property("id", th.IntegerType),
         th.Property("date", th.DateTimeType),
@@ -289,6 +413,7 @@ class GroupsStream(LearnDashStream):
     name = "groups"
     path = "/groups"
     primary_keys = ["id"]
+    replication_key = "modified_gmt"
     schema = th.PropertiesList(
         th.Property("id", th.IntegerType),
         th.Property("date", th.DateTimeType),
@@ -338,6 +463,8 @@ class LessonsStream(LearnDashStream):
     name = "lessons"
     path = "/sfwd-lessons"
     primary_keys = ["id"]
+    replication_key = "modified_gmt"
+    step_type = "sfwd-lessons"
     schema = th.PropertiesList(
         th.Property("id", th.IntegerType),
         th.Property("date", th.DateTimeType),
@@ -403,6 +530,7 @@ class QuestionsStream(LearnDashStream):
     name = "questions"
     path = "/sfwd-question"
     primary_keys = ["id"]
+    replication_key = "modified_gmt"
     schema = th.PropertiesList(
         th.Property("id", th.IntegerType),
         th.Property("date", th.DateTimeType),
@@ -448,6 +576,8 @@ class TopicsStream(LearnDashStream):
     name = "topics"
     path = "/sfwd-topic"
     primary_keys = ["id"]
+    replication_key = "modified_gmt"
+    step_type = "sfwd-topic"
     schema = th.PropertiesList(
         th.Property("id", th.IntegerType),
         th.Property("date", th.DateTimeType),
@@ -510,6 +640,7 @@ class UserCourseProgressStream(LearnDashStream):
     primary_keys = ["user_id", "course"]
     parent_stream_type = UsersStream
     ignore_parent_replication_keys = True
+    partition_key = "user_id"
     schema = th.PropertiesList(
         th.Property("user_id", th.IntegerType),
         th.Property("course", th.IntegerType),
@@ -521,6 +652,109 @@ class UserCourseProgressStream(LearnDashStream):
         th.Property("date_completed", th.DateTimeType)
     ).to_dict()
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Initialize the stream and its per-site bulk mode caches."""
+        super().__init__(*args, **kwargs)
+        self._bulk_lock = threading.Lock()
+        self._enrolled_user_ids: Dict[Optional[str], List[int]] = {}
+        self._progress_lookaheads: Dict[Optional[str], Lookahead] = {}
+
+    def reset_caches(self) -> None:
+        """Drop the enrolled users and progress requests of the current cycle."""
+        with self._bulk_lock:
+            self._enrolled_user_ids.clear()
+            for lookahead in self._progress_lookaheads.values():
+                lookahead.cancel()
+            self._progress_lookaheads.clear()
+
+    @property
+    def pipeline_depth(self) -> int:
+        """Return how many users' progress may be requested ahead."""
+        if self.tap.plan is None:
+            return self.tap.max_workers
+        return self.page_workers
+
+    def get_enrolled_user_ids(self, context: dict) -> List[int]:
+        """Return the sorted ids of users enrolled in any course of the site.
+
+        Enrolments are read from the id-only user listings of every course,
+        requested concurrently. All courses are listed even with `course_ids`
+        set, as progress is emitted for every course a user is enrolled in.
+        """
+        site_context = self.get_site_context(context)
+        site_id = site_context.get("site_id")
+        with self._bulk_lock:
+            if site_id in self._enrolled_user_ids:
+                return self._enrolled_user_ids[site_id]
+        courses_stream: Any = self.tap.streams["courses"]
+        course_users_stream: Any = self.tap.streams["course_users"]
+        # Requests drops None-valued parameters, so every course is listed.
+        course_ids = list(
+            courses_stream.request_ids(
+                site_context or None, {"include": None, "modified_after": None}
+            )
+        )
+        enrolled_user_ids = set()
+        for user_ids in ordered_map(
+            cast(Executor, self.tap.fetch_executor),
+            lambda course_id: list(
+                course_users_stream.request_ids(
+                    {**site_context, "course_id": course_id}
+                )
+            ),
+            course_ids,
+            self.tap.max_workers,
+        ):
+            enrolled_user_ids.update(user_ids)
+        self.logger.info(
+            f"Found {len(enrolled_user_ids)} enrolled users "
+            f"in {len(course_ids)} courses."
+        )
+        with self._bulk_lock:
+            self._enrolled_user_ids[site_id] = sorted(enrolled_user_ids)
+            return self._enrolled_user_ids[site_id]
+
+    def get_progress_lookahead(self, context: dict) -> Lookahead:
+        """Return the lookahead of progress requests of the context's site."""
+        site_context = self.get_site_context(context)
+        with self._bulk_lock:
+            site_id = site_context.get("site_id")
+            if site_id not in self._progress_lookaheads:
+                self._progress_lookaheads[site_id] = Lookahead(
+                    cast(Executor, self.tap.fetch_executor),
+                    lambda user_id: self.request_user_progress(
+                        {**site_context, "user_id": user_id}
+                    ),
+                )
+            return self._progress_lookaheads[site_id]
+
+    def request_user_progress(self, context: dict) -> List[dict]:
+        """Request all pages of a user's course progress."""
+        return [
+            row
+            for response in self.request_pages(context, concurrent=False)
+            for row in self.parse_response(response)
+        ]
+
+    def request_records(self, context: Optional[dict]) -> Iterable[dict]:
+        """Return the user's course progress, in bulk mode only for enrolled users.
+
+        Users are paged in id order, so in bulk mode the progress of the next
+        `pipeline_depth` enrolled users is requested ahead of their partitions.
+        """
+        if not self.config.get("bulk_user_progress"):
+            yield from super().request_records(context)
+            return
+        context = cast(dict, context)
+        enrolled_user_ids = self.get_enrolled_user_ids(context)
+        future = self.get_progress_lookahead(context).visit(
+            context["user_id"], enrolled_user_ids, self.pipeline_depth
+        )
+        if future is None:
+            # Not enrolled in any course, so there is no progress to request.
+            return
+        yield from future.result()
+
     def post_process(self, row: dict, context: Optional[dict] = None) -> dict:
         """Append user_id to record"""
         row["user_id"] = context["user_id"]
@@ -529,6 +763,7 @@ class UserCourseProgressStream(LearnDashStream):
     def get_child_context(self, record: dict, context: Optional[dict]) -> dict:
         """Return a context dictionary for child streams."""
         return {
+            **self.get_site_context(context),
             "user_id": record["user_id"],
             "course_id": record["course"]
         }
@@ -541,6 +776,7 @@ class UserCoursesStream(LearnDashStream):
     primary_keys = ["user_id", "id"]
     parent_stream_type = UsersStream
     ignore_parent_replication_keys = True
+    partition_key = "user_id"
     schema = th.PropertiesList(
         th.Property("user_id", th.IntegerType),
         th.Property("id", th.IntegerType),
@@ -585,6 +821,7 @@ class UserGroupsStream(LearnDashStream):
     primary_keys = ["user_id", "id"]
     parent_stream_type = UsersStream
     ignore_parent_replication_keys = True
+    partition_key = "user_id"
     schema = th.PropertiesList(
         th.Property("user_id", th.IntegerType),
         th.Property("id", th.IntegerType),
@@ -621,6 +858,8 @@ class QuizzesStream(LearnDashStream):
     name = "quizzes"
     path = "/sfwd-quiz"
     primary_keys = ["id"]
+    replication_key = "modified_gmt"
+    step_type = "sfwd-quiz"
     schema = th.PropertiesList(
         th.Property("id", th.IntegerType),
         th.Property("date", th.DateTimeType),
@@ -705,6 +944,7 @@ class QuizzesStream(LearnDashStream):
     def get_child_context(self, record: dict, context: Optional[dict]) -> dict:
         """Return a context dictionary for child streams."""
         return {
+            **self.get_site_context(context),
             "quiz_id": record["id"]
         }
 
@@ -1,15 +1,30 @@
 """LearnDash tap class."""
 
-from typing import List
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Dict, List, Optional, Set, Tuple, cast
 
+import requests
 from singer_sdk import Tap, Stream
 from singer_sdk import typing as th  # JSON schema typing helpers
+from singer_sdk.exceptions import ConfigValidationError
 
+from tap_learndash.archive import ARCHIVE_MODES, HttpArchive, mount_archive
+from tap_learndash.client import LearnDashStream, RuntimeBudgetExhausted, utc_now
+from tap_learndash.planner import ProgressReporter, WorkPlan
+from tap_learndash.profiling import profile_stream
+from tap_learndash.ratelimit import RateLimiter
+from tap_learndash.state import sync_priority
 from tap_learndash.streams import (
     CoursesStream,
     CourseUsersStream,
     CoursePrerequisitesStream,
     CourseGroupsStream,
+    CourseStepsStream,
     AssignmentsStream,
     EssaysStream,
     GroupsStream,
@@ -28,6 +43,7 @@ STREAM_TYPES = [
     CourseUsersStream,
     CoursePrerequisitesStream,
     CourseGroupsStream,
+    CourseStepsStream,
     AssignmentsStream,
     EssaysStream,
     GroupsStream,
@@ -47,11 +63,345 @@ class TapLearnDash(Tap):
     name = "tap-learndash"
 
     config_jsonschema = th.PropertiesList(
-        th.Property("username", th.StringType, required=True),
-        th.Property("password", th.StringType, required=True),
-        th.Property("api_url", th.StringType, required=True),
+        th.Property("username", th.StringType),
+        th.Property("password", th.StringType),
+        th.Property("api_url", th.StringType),
+        th.Property("sites", th.ArrayType(th.ObjectType(
+            th.Property("site_id", th.StringType, required=True),
+            th.Property("api_url", th.StringType, required=True),
+            th.Property("username", th.StringType, required=True),
+            th.Property("password", th.StringType, required=True),
+            th.Property("course_ids", th.ArrayType(th.IntegerType))
+        ))),
+        th.Property("max_workers", th.IntegerType),
+        th.Property("max_requests_per_second", th.NumberType),
+        th.Property("max_parallel_streams", th.IntegerType),
+        th.Property("preflight_plan", th.BooleanType),
+        th.Property("daemon", th.BooleanType),
+        th.Property("poll_interval_seconds", th.IntegerType),
+        th.Property("poll_intervals", th.ObjectType()),
+        th.Property("course_ids", th.ArrayType(th.IntegerType)),
+        th.Property("bulk_user_progress", th.BooleanType),
+        th.Property("sliced_streams", th.ArrayType(th.StringType)),
+        th.Property("slice_window_size", th.IntegerType),
+        th.Property("progress_interval_seconds", th.IntegerType),
+        th.Property("prefetch_depth", th.IntegerType),
+        th.Property("max_runtime_seconds", th.IntegerType),
+        th.Property("profile_dir", th.StringType),
+        th.Property("http_archive_mode", th.StringType),
+        th.Property("http_archive_path", th.StringType),
     ).to_dict()
 
+    # Monotonic clock time at which the current run must stop, if budgeted.
+    deadline: Optional[float] = None
+    # UTC time, as ISO 8601, at which the current sync cycle started.
+    cycle_started_at: Optional[str] = None
+    # Archive that HTTP traffic is recorded to or replayed from, if configured.
+    http_archive: Optional[HttpArchive] = None
+    # Expected work per stream and progress against it, when planning is enabled.
+    plan: Optional[WorkPlan] = None
+    progress: Optional[ProgressReporter] = None
+    # Pool for concurrent page requests; its tasks never wait on other tasks.
+    fetch_executor: Optional[ThreadPoolExecutor] = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Initialize the tap and the locks and limits its streams share."""
+        self.state_lock = threading.RLock()
+        super().__init__(*args, **kwargs)
+        self.validate_connection_config()
+        self.rate_limiter = RateLimiter(self.config.get("max_requests_per_second"))
+        # Caps in-flight requests across all stream threads and fetch workers.
+        self.request_slots = threading.BoundedSemaphore(self.max_workers)
+
+    def validate_connection_config(self) -> None:
+        """Raise `ConfigValidationError` unless the sites to extract are complete.
+
+        Either `sites` or the single-site `api_url`, `username` and `password`
+        must be set. Course ids differ between WordPress installs, so with
+        `sites` they are configured per site. An HTTP archive needs a known
+        mode and a path.
+        """
+        http_archive_mode = self.config.get("http_archive_mode")
+        if http_archive_mode and http_archive_mode not in ARCHIVE_MODES:
+            raise ConfigValidationError(
+                f"Unknown `http_archive_mode` '{http_archive_mode}'; "
+                f"use one of {', '.join(ARCHIVE_MODES)}."
+            )
+        if http_archive_mode and not self.config.get("http_archive_path"):
+            raise ConfigValidationError(
+                "`http_archive_mode` requires `http_archive_path`."
+            )
+        if self.config.get("sites"):
+            if self.config.get("course_ids"):
+                raise ConfigValidationError(
+                    "`course_ids` cannot be combined with `sites`; "
+                    "set `course_ids` on each site instead."
+                )
+            return
+        missing = [
+            key for key in ("api_url", "username", "password")
+            if not self.config.get(key)
+        ]
+        if missing:
+            raise ConfigValidationError(
+                f"Config is missing {', '.join(missing)}; set these or `sites`."
+            )
+
+    @property
+    def max_workers(self) -> int:
+        """Return the worker budget shared by sites and concurrent requests."""
+        return int(self.config.get("max_workers", 4))
+
+    @property
+    def max_parallel_streams(self) -> int:
+        """Return how many top-level streams, of any site, may sync at once."""
+        default = min(len(self.site_contexts), self.max_workers)
+        return int(self.config.get("max_parallel_streams", default))
+
+    @property
+    def sites(self) -> Dict[str, dict]:
+        """Return the configured sites by site id."""
+        return {site["site_id"]: site for site in self.config.get("sites", [])}
+
+    @property
+    def site_contexts(self) -> List[Optional[dict]]:
+        """Return a sync context per configured site, or None for a single site."""
+        if not self.sites:
+            return [None]
+        return [{"site_id": site_id} for site_id in self.sites]
+
     def discover_streams(self) -> List[Stream]:
         """Return a list of discovered streams."""
         return [stream_class(tap=self) for stream_class in STREAM_TYPES]
+
+    def get_scheduled_streams(
+        self,
+        site_context: Optional[dict] = None,
+        stream_names: Optional[Set[str]] = None,
+    ) -> List[LearnDashStream]:
+        """Return the top-level streams to sync, most due first."""
+        streams = [
+            cast(LearnDashStream, stream)
+            for stream in self.streams.values()
+            if (stream.selected or stream.has_selected_descendents)
+            and not stream.parent_stream_type
+            and (stream_names is None or stream.name in stream_names)
+        ]
+        return sorted(
+            streams,
+            key=lambda stream: sync_priority(stream.get_context_state(site_context)),
+        )
+
+    def build_plan(self) -> WorkPlan:
+        """Estimate the work of each selected stream with cheap count requests.
+
+        Top-level streams report their totals in `X-WP-Total`, or are counted
+        from the configured courses' steps when course-scoped. Their child
+        streams are expected to need one partition per parent record.
+        """
+        plan = WorkPlan()
+        for site_context in self.site_contexts:
+            for stream in self.get_scheduled_streams(site_context):
+                total, request_count = stream.estimate_work(site_context)
+                plan.add(stream.name, total, request_count)
+                for child_stream in stream.child_streams:
+                    if child_stream.selected or child_stream.has_selected_descendents:
+                        plan.add(child_stream.name, total, total, level=1)
+        plan.log_summary(self.logger, self.max_workers)
+        return plan
+
+    def create_http_session(self) -> requests.Session:
+        """Return a new HTTP session, routed through the HTTP archive if any."""
+        session = requests.Session()
+        if self.http_archive:
+            mount_archive(session, self.http_archive)
+        return session
+
+    def profile(
+        self, stream: LearnDashStream, site_context: Optional[dict] = None
+    ) -> ContextManager[None]:
+        """Return a context that profiles the stream's sync if `profile_dir` is set."""
+        profile_dir = self.config.get("profile_dir")
+        if not profile_dir:
+            return nullcontext()
+        profile_name = "-".join([stream.name, *(site_context or {}).values()])
+        return profile_stream(profile_name, Path(profile_dir), self.logger)
+
+    def get_poll_interval(self, stream_name: str) -> float:
+        """Return the seconds between syncs of a stream in daemon mode."""
+        poll_intervals = self.config.get("poll_intervals", {})
+        return poll_intervals.get(
+            stream_name, self.config.get("poll_interval_seconds", 300)
+        )
+
+    def _start_cycle(self) -> None:
+        """Reset per-sync progress and start the runtime budget."""
+        self.cycle_started_at = utc_now()
+        self._reset_state_progress_markers()
+        if self.progress:
+            self.progress.reset()
+        max_runtime_seconds = self.config.get("max_runtime_seconds")
+        if max_runtime_seconds:
+            self.deadline = time.monotonic() + max_runtime_seconds
+
+    def sync_all(self) -> None:
+        """Sync all streams, most due first, until done or out of runtime budget."""
+        self._set_compatible_replication_methods()
+        http_archive_mode = self.config.get("http_archive_mode")
+        if http_archive_mode:
+            self.http_archive = HttpArchive(
+                Path(self.config["http_archive_path"]), http_archive_mode
+            )
+        self.fetch_executor = ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix="ld-fetch"
+        )
+        try:
+            if self.config.get("preflight_plan"):
+                self.plan = self.build_plan()
+                self.progress = ProgressReporter(
+                    self.plan,
+                    self.logger,
+                    self.config.get("progress_interval_seconds", 30),
+                )
+            if self.config.get("daemon"):
+                self._run_daemon()
+            else:
+                self._start_cycle()
+                self._sync_streams()
+            if self.progress:
+                self.progress.report()
+        finally:
+            self.fetch_executor.shutdown()
+            if self.http_archive:
+                self.http_archive.close()
+
+    def _run_daemon(self) -> None:
+        """Sync streams repeatedly, each on its own poll interval, until stopped.
+
+        Stream instances, and with them their HTTP sessions and course steps
+        cache, stay alive between cycles; other per-cycle caches are cleared
+        after each cycle so memory stays bounded. A stream is only rescheduled
+        once it synced completely; streams the cycle's runtime budget did not
+        cover stay due. SIGTERM or Ctrl-C (SIGINT) ends the current cycle at its
+        next budget check, checkpointing state, and stops the daemon.
+        """
+        stop = threading.Event()
+
+        def handle_stop(signum: int, frame: Any) -> None:
+            self.logger.info("Daemon stopping after checkpointing the current cycle.")
+            stop.set()
+            self.deadline = time.monotonic()
+
+        previous_handlers = {
+            signum: signal.signal(signum, handle_stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        next_due: Dict[str, float] = {}
+        try:
+            while not stop.is_set():
+                scheduled_streams = self.get_scheduled_streams()
+                if not scheduled_streams:
+                    return
+                now = time.monotonic()
+                due = {
+                    stream.name
+                    for stream in scheduled_streams
+                    if next_due.get(stream.name, now) <= now
+                }
+                if not due:
+                    stop.wait(max(min(next_due.values()) - now, 0))
+                    continue
+                self._start_cycle()
+                for stream_name in self._sync_streams(due):
+                    next_due[stream_name] = (
+                        time.monotonic() + self.get_poll_interval(stream_name)
+                    )
+                for stream in self.streams.values():
+                    cast(LearnDashStream, stream).reset_caches()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def _sync_streams(self, stream_names: Optional[Set[str]] = None) -> Set[str]:
+        """Sync the scheduled streams of every site, most due first.
+
+        Top-level streams are independent of each other, so up to
+        `max_parallel_streams` of them, each with its child streams, sync in
+        parallel threads. Message writes and state updates are serialized by
+        the streams through `state_lock`.
+
+        Returns the names of the streams synced completely on every site.
+        """
+        units = sorted(
+            (
+                (stream, site_context)
+                for site_context in self.site_contexts
+                for stream in self.get_scheduled_streams(site_context, stream_names)
+            ),
+            key=lambda unit: sync_priority(unit[0].get_context_state(unit[1])),
+        )
+        if self.max_parallel_streams <= 1:
+            results = [False] * len(units)
+            for index, (stream, site_context) in enumerate(units):
+                results[index] = self._sync_stream(stream, site_context)
+                if not results[index]:
+                    break
+        else:
+            results = self._sync_units_in_parallel(units)
+        unfinished = {
+            stream.name for (stream, _), finished in zip(units, results) if not finished
+        }
+        return {stream.name for stream, _ in units} - unfinished
+
+    def _sync_units_in_parallel(
+        self, units: List[Tuple[LearnDashStream, Optional[dict]]]
+    ) -> List[bool]:
+        """Sync (stream, site context) units on a pool, returning their results.
+
+        If a unit fails, the units that have not started yet are cancelled and
+        the deadline is moved to now, so the running ones stop at their next
+        budget check and checkpoint before the error is raised.
+        """
+        results = [False] * len(units)
+        with ThreadPoolExecutor(
+            self.max_parallel_streams, thread_name_prefix="ld-stream"
+        ) as pool:
+            futures = {
+                pool.submit(self._sync_stream, stream, site_context): index
+                for index, (stream, site_context) in enumerate(units)
+            }
+            try:
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+            except BaseException:
+                self.deadline = time.monotonic()
+                for future in futures:
+                    future.cancel()
+                raise
+        return results
+
+    def _sync_stream(
+        self, stream: LearnDashStream, site_context: Optional[dict]
+    ) -> bool:
+        """Sync a top-level stream of a site, returning False if out of budget.
+
+        A stream the budget runs out on is marked interrupted, so it resumes
+        from its cursor after the streams that did not get to run.
+        """
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return False
+        try:
+            with self.profile(stream, site_context):
+                stream.sync(site_context)
+        except RuntimeBudgetExhausted as ex:
+            self.logger.info(f"{ex} Remaining streams resume on the next run.")
+            stream.mark_interrupted(utc_now(), site_context)
+            stream.finalize_state_progress_markers(
+                stream.get_context_state(site_context)
+            )
+            stream._write_state_message()
+            return False
+        stream.finalize_state_progress_markers(stream.get_context_state(site_context))
+        stream.mark_synced(utc_now(), site_context)
+        stream._write_state_message()
+        return True
@@ -0,0 +1,93 @@
+"""Tests for the HTTP record/replay archive."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from tap_learndash.archive import HttpArchive, HttpArchiveMiss, mount_archive
+
+
+class _CoursesHandler(BaseHTTPRequestHandler):
+    """Serve a page of courses, counting the requests it receives."""
+
+    requests_served = 0
+
+    def do_GET(self):
+        type(self).requests_served += 1
+        body = json.dumps([{"id": 1, "path": self.path}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-WP-TotalPages", "3")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    """Run the courses handler on a local port for the duration of a test."""
+    server = HTTPServer(("127.0.0.1", 0), _CoursesHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _session(archive):
+    session = requests.Session()
+    mount_archive(session, archive)
+    return session
+
+
+def test_archive_replays_recorded_responses(tmp_path, server_url):
+    """A replayed response has the recorded status, body and paging headers."""
+    path = tmp_path / "archive.zip"
+    url = f"{server_url}/wp-json/ldlms/v2/sfwd-courses?page=2"
+    archive = HttpArchive(path, "record")
+    recorded = _session(archive).get(url)
+    archive.close()
+
+    archive = HttpArchive(path, "replay")
+    replayed = _session(archive).get(url)
+    archive.close()
+    assert replayed.status_code == recorded.status_code == 200
+    assert replayed.content == recorded.content
+    assert replayed.json() == recorded.json()
+    assert replayed.json()[0]["path"] == "/wp-json/ldlms/v2/sfwd-courses?page=2"
+    assert replayed.headers["X-WP-TotalPages"] == "3"
+
+
+def test_archive_records_each_request_once(tmp_path, server_url):
+    """Repeating a request while recording does not add another entry."""
+    path = tmp_path / "archive.zip"
+    archive = HttpArchive(path, "record")
+    session = _session(archive)
+    for _ in range(3):
+        session.get(f"{server_url}/courses")
+    session.get(f"{server_url}/users")
+    archive.close()
+    archive = HttpArchive(path, "replay")
+    assert len(archive._zip.namelist()) == 5
+    archive.close()
+
+
+def test_archive_miss_raises(tmp_path, server_url):
+    """Replaying a request that was never recorded raises `HttpArchiveMiss`."""
+    path = tmp_path / "archive.zip"
+    archive = HttpArchive(path, "record")
+    _session(archive).get(f"{server_url}/courses")
+    archive.close()
+
+    archive = HttpArchive(path, "replay")
+    served = _CoursesHandler.requests_served
+    with pytest.raises(HttpArchiveMiss):
+        _session(archive).get(f"{server_url}/users")
+    archive.close()
+    assert _CoursesHandler.requests_served == served
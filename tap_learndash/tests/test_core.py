@@ -4,6 +4,7 @@ import datetime
 
 from singer_sdk.testing import get_standard_tap_tests
 
+from tap_learndash.streams import flatten_course_steps
 from tap_learndash.tap import TapLearnDash
 
 SAMPLE_CONFIG = {
@@ -23,4 +24,20 @@ def test_standard_tap_tests():
         test()
 
 
+def test_flatten_course_steps():
+    """Nested course steps flatten to rows linked to their parent step."""
+    hierarchy = {
+        "sfwd-lessons": {"10": {"sfwd-topic": {"11": {"sfwd-quiz": []}}}},
+        "sfwd-quiz": {"20": []},
+    }
+    assert list(flatten_course_steps(hierarchy)) == [
+        {"step_id": 10, "step_type": "sfwd-lessons", "parent_step_id": None,
+         "step_order": 0},
+        {"step_id": 11, "step_type": "sfwd-topic", "parent_step_id": 10,
+         "step_order": 0},
+        {"step_id": 20, "step_type": "sfwd-quiz", "parent_step_id": None,
+         "step_order": 1},
+    ]
+
+
 # TODO: Create additional tests as appropriate for your tap.
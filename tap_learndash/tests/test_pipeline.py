@@ -0,0 +1,72 @@
+"""Tests for the request pipelining helpers."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tap_learndash.pipeline import Lookahead, prefetch
+
+
+def test_prefetch_preserves_order():
+    """Prefetched items arrive in their original order."""
+    assert list(prefetch(range(10), depth=2)) == list(range(10))
+
+
+def test_prefetch_reraises_producer_errors():
+    """An error raised while producing is re-raised to the consumer."""
+    def failing():
+        yield 1
+        raise ValueError("boom")
+
+    items = prefetch(failing(), depth=1)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="boom"):
+        next(items)
+
+
+def _gated_lookahead(calls):
+    """Return a single-worker lookahead whose requests wait for the gate."""
+    gate = threading.Event()
+
+    def request(key):
+        calls.append(key)
+        gate.wait(5)
+        return key * 10
+
+    executor = ThreadPoolExecutor(1)
+    return Lookahead(executor, request), gate, executor
+
+
+def test_lookahead_requests_upcoming_wanted_keys():
+    """Only wanted keys are requested; unwanted ones get no request at all."""
+    calls = []
+    lookahead, gate, executor = _gated_lookahead(calls)
+    wanted = [2, 5, 7, 9]
+    assert lookahead.visit(1, wanted, 2) is None
+    gate.set()
+    assert lookahead.visit(2, wanted, 2).result() == 20
+    assert lookahead.visit(3, wanted, 2) is None
+    assert lookahead.visit(5, wanted, 2).result() == 50
+    executor.shutdown()
+    assert calls == [2, 5, 7]
+
+
+def test_lookahead_cancels_passed_over_keys():
+    """Requests of keys skipped by the visits, or left over, are cancelled."""
+    calls = []
+    lookahead, gate, executor = _gated_lookahead(calls)
+    wanted = [2, 5, 7, 9, 11]
+    lookahead.visit(1, wanted, 3)
+    skipped = dict(lookahead._pending)
+    future = lookahead.visit(7, wanted, 3)
+    assert skipped[5].cancelled()
+    left_over = lookahead.visit(8, wanted, 3)
+    assert left_over is None
+    pending = list(lookahead._pending.values())
+    lookahead.cancel()
+    assert all(future.cancelled() for future in pending)
+    gate.set()
+    assert future.result() == 70
+    executor.shutdown()
+    assert calls == [2, 7]
@@ -0,0 +1,69 @@
+"""Tests for work planning and progress reporting."""
+
+import logging
+
+import pytest
+
+from tap_learndash.planner import ProgressReporter, WorkPlan, plan_id_windows
+
+
+def test_workers_for_splits_workers_within_a_level():
+    """Streams share workers by requests, only with streams at their level."""
+    plan = WorkPlan()
+    plan.add("users", 3000, 30)
+    plan.add("courses", 1000, 10)
+    plan.add("user_course_progress", 3000, 3000, level=1)
+    assert plan.workers_for("users", 8) == 6
+    assert plan.workers_for("courses", 8) == 2
+    assert plan.workers_for("user_course_progress", 8) == 8
+
+
+def test_workers_for_gives_at_least_one_worker():
+    """Tiny and unplanned streams still get a worker."""
+    plan = WorkPlan()
+    plan.add("users", 100000, 1000)
+    plan.add("groups", 1, 1)
+    assert plan.workers_for("groups", 4) == 1
+    assert WorkPlan().workers_for("users", 4) == 1
+
+
+def test_eta_extrapolates_throughput():
+    """The ETA is the remaining work at the throughput so far."""
+    plan = WorkPlan()
+    plan.add("users", 100, 1)
+    progress = ProgressReporter(plan, logging.getLogger(__name__))
+    progress._started["users"] = 0.0
+    progress._done["users"] = 25
+    assert progress._eta("users", 10.0) == pytest.approx(30.0)
+    progress._done["users"] = 120
+    assert progress._eta("users", 10.0) == 0
+
+
+def test_eta_unknown_without_plan_or_progress():
+    """No ETA is given for unplanned or not yet started streams."""
+    plan = WorkPlan()
+    plan.add("users", 100, 1)
+    progress = ProgressReporter(plan, logging.getLogger(__name__))
+    assert progress._eta("users", 10.0) is None
+    progress._started["courses"] = 0.0
+    progress._done["courses"] = 5
+    assert progress._eta("courses", 10.0) is None
+
+
+def test_plan_id_windows_follows_density():
+    """Sparse ids get wider windows, dense ids windows of `window_size` ids."""
+    assert plan_id_windows(1, 1000, 100, 25, 500) == [
+        (1, 250), (251, 500), (501, 750), (751, 1000)
+    ]
+    assert plan_id_windows(11, 260, 250, 100, 500) == [
+        (11, 110), (111, 210), (211, 260)
+    ]
+
+
+def test_plan_id_windows_caps_span():
+    """No window lists more than `max_span` ids."""
+    windows = plan_id_windows(1, 100000, 10, 100, 500)
+    assert len(windows) == 200
+    assert all(end - start + 1 <= 500 for start, end in windows)
+    assert windows[-1] == (99501, 100000)
+    assert plan_id_windows(1, 10, 0, 100, 500) == []
@@ -0,0 +1,83 @@
+"""Tests for compact state encodings."""
+
+from tap_learndash.state import (
+    IdRangeSet, PartitionWatermark, ResumeCursor, sync_priority
+)
+
+
+def test_id_range_set_merges_adjacent_ids():
+    """Ids added in any order collapse into contiguous ranges."""
+    ids = IdRangeSet([5, 1, 3, 2, 10, 4, 12, 11])
+    assert ids.encode() == "1-5,10-12"
+    assert len(ids) == 8
+    assert 3 in ids and 6 not in ids
+
+
+def test_id_range_set_round_trips():
+    """Decoding an encoded set returns the same ids."""
+    ids = IdRangeSet.decode("1-500,502,510-900")
+    assert ids.encode() == "1-500,502,510-900"
+    ids.add(501)
+    assert ids.encode() == "1-502,510-900"
+    assert list(IdRangeSet.decode("")) == []
+
+
+def test_resume_cursor_skips_written_records():
+    """A resumed sync restarts a page early and skips records already written."""
+    state: dict = {}
+    cursor = ResumeCursor(state)
+    assert cursor.first_page == 1
+    assert [row["id"] for row in cursor.skip_synced([{"id": 1}])] == [1]
+    cursor.advance(4, 350)
+
+    resumed = ResumeCursor(state)
+    assert resumed.first_page == 3
+    rows = [{"id": id_} for id_ in (340, 350, 351, 360)]
+    assert [row["id"] for row in resumed.skip_synced(rows)] == [351, 360]
+
+    state["interrupted_at"] = "2021-01-02T00:00:00+00:00"
+    state["resume_signpost"] = "2021-01-01T23:00:00+00:00"
+    resumed.clear()
+    assert state == {}
+
+
+def test_sync_priority_puts_interrupted_streams_last():
+    """Never synced streams go first and interrupted ones go behind all others."""
+    states = {
+        "courses": {"last_synced_at": "2021-01-01T00:00:00+00:00"},
+        "users": {"interrupted_at": "2021-01-03T00:00:00+00:00"},
+        "groups": {},
+        "quizzes": {
+            "last_synced_at": "2020-12-01T00:00:00+00:00",
+            "interrupted_at": "2021-01-02T00:00:00+00:00",
+        },
+        "lessons": {"last_synced_at": "2020-12-31T00:00:00+00:00"},
+    }
+    order = sorted(states, key=lambda name: sync_priority(states[name]))
+    assert order == ["groups", "lessons", "courses", "quizzes", "users"]
+
+
+def test_partition_watermark_stays_constant_size():
+    """Partitions finished in id order leave only a high-water mark."""
+    watermark = PartitionWatermark()
+    for id_ in range(1, 100000, 7):
+        watermark.start(id_)
+        watermark.finish(id_)
+    assert watermark.encode() == {"through_id": 99996}
+    assert 50 in watermark and 99997 not in watermark and None not in watermark
+
+
+def test_partition_watermark_keeps_ids_finished_out_of_order():
+    """Ids finished above a running partition are exceptions until it finishes."""
+    watermark = PartitionWatermark.decode({"through_id": 10})
+    for id_ in (12, 15, 20):
+        watermark.start(id_)
+    watermark.finish(15)
+    watermark.finish(20)
+    assert watermark.encode() == {"through_id": 10, "exceptions": [15, 20]}
+
+    resumed = PartitionWatermark.decode(watermark.encode())
+    assert 15 in resumed and 12 not in resumed
+    resumed.start(12)
+    resumed.finish(12)
+    assert resumed.encode() == {"through_id": 20}